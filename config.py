@@ -1,15 +1,55 @@
 """
 Configuration for the Honeypot API.
+Environment (and .env, if python-dotenv is installed) is read once at
+import into a frozen Settings instance; modules import the constants.
 """
 
 import os
+from dataclasses import dataclass
 
-API_KEY = os.getenv("API_KEY", "test123")
-GUVI_CALLBACK_URL = os.getenv(
-    "GUVI_CALLBACK_URL",
-    "https://hackathon.guvi.in/api/updateHoneyPotFinalResult",
-)
-HF_API_TOKEN = os.getenv("HF_API_TOKEN", "")
-HF_MODEL = os.getenv("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.3")
-FINAL_OUTPUT_MIN_TURN = 5
-MAX_TURNS = 10
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+if load_dotenv is not None:
+    load_dotenv()
+
+
+@dataclass(frozen=True)
+class Settings:
+    API_KEY: str = os.getenv("API_KEY", "test123")
+    GUVI_CALLBACK_URL: str = os.getenv(
+        "GUVI_CALLBACK_URL",
+        "https://hackathon.guvi.in/api/updateHoneyPotFinalResult",
+    )
+    HF_API_TOKEN: str = os.getenv("HF_API_TOKEN", "")
+    HF_MODEL: str = os.getenv("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.3")
+    HF_BATCH_SIZE: int = int(os.getenv("HF_BATCH_SIZE", "8"))
+    HF_BATCH_WAIT_MS: int = int(os.getenv("HF_BATCH_WAIT_MS", "25"))
+    HF_STREAM: bool = os.getenv("HF_STREAM", "1") != "0"
+    ASYNC_LLM: bool = os.getenv("ASYNC_LLM", "1") != "0"
+    MAX_SESSIONS: int = int(os.getenv("MAX_SESSIONS", "10000"))
+    SESSION_TTL_SECONDS: int = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    # Sessions live in process memory, so more than one worker needs sticky
+    # routing by sessionId (or an external session store)
+    WORKERS: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    FINAL_OUTPUT_MIN_TURN: int = 5
+    MAX_TURNS: int = 10
+
+
+SETTINGS = Settings()
+
+API_KEY = SETTINGS.API_KEY
+GUVI_CALLBACK_URL = SETTINGS.GUVI_CALLBACK_URL
+HF_API_TOKEN = SETTINGS.HF_API_TOKEN
+HF_MODEL = SETTINGS.HF_MODEL
+HF_BATCH_SIZE = SETTINGS.HF_BATCH_SIZE
+HF_BATCH_WAIT_MS = SETTINGS.HF_BATCH_WAIT_MS
+HF_STREAM = SETTINGS.HF_STREAM
+ASYNC_LLM = SETTINGS.ASYNC_LLM
+MAX_SESSIONS = SETTINGS.MAX_SESSIONS
+SESSION_TTL_SECONDS = SETTINGS.SESSION_TTL_SECONDS
+WORKERS = SETTINGS.WORKERS
+FINAL_OUTPUT_MIN_TURN = SETTINGS.FINAL_OUTPUT_MIN_TURN
+MAX_TURNS = SETTINGS.MAX_TURNS
@@ -2,111 +2,97 @@
 Conversation engine for the Honeypot API.
 Uses HuggingFace LLM with smart fallback responses,
 response deduplication, and scam-context-aware category selection.
+Concurrent LLM calls are dynamically batched into single HF requests.
 """
 
+import asyncio
+import hashlib
+import json
+import queue
 import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
 import requests
-from typing import Optional
-
-from config import HF_API_TOKEN, HF_MODEL
-
-# ---- System Prompt for LLM ----
-
-SYSTEM_PROMPT = """You are playing the role of a naive, slightly worried Indian citizen who has received a suspicious message. Your goal is to keep the scammer engaged for as long as possible while extracting maximum information from them.
-
-CRITICAL RULES:
-1. NEVER reveal you know it's a scam. Act genuinely concerned but slightly confused.
-2. Ask ONE investigative question per response to extract information.
-3. Keep responses SHORT (1-3 sentences max).
-4. Show willingness to comply but always ask for "verification" first.
-5. Reference specific red flags subtly (urgency, OTP requests, suspicious links).
-6. Try to extract: phone numbers, email addresses, UPI IDs, official websites, employee IDs.
-7. Sound natural — use simple language, occasional Hindi words, show emotions.
-8. DO NOT use markdown formatting, bullet points, or numbered lists.
-9. Vary your responses — never repeat the same question twice."""
-
-# ---- Fallback Rule-Based Responses ----
-
-FALLBACK_RESPONSES = {
-    "early": [
-        "Oh my, this sounds serious! Can you please tell me your name and employee ID so I can note it down?",
-        "I'm really worried now. Can you share your official phone number so I can call you back to verify?",
-        "This is concerning. Which branch are you calling from? I want to make sure this is legitimate.",
-        "Oh no, what should I do? Can you please give me a reference number for this case?",
-        "I want to cooperate but I'm scared. Can you tell me your department and designation first?",
-    ],
-    "mid": [
-        "I understand the urgency, but my family told me to always verify. Can you share your official email ID?",
-        "Can you give me your supervisor's name and number? I'd like to confirm before sharing anything.",
-        "What is the official website where I can check this myself? I want to be careful.",
-        "My son told me to never share OTP on phone. Can you send me an official letter instead?",
-        "I'm at home right now. Can I visit the nearest branch to resolve this? Which branch should I go to?",
-    ],
-    "late": [
-        "I've been noting everything down. Can you give me the full address of your office for my records?",
-        "Before we proceed, can you spell out your full name and share your direct extension number?",
-        "My neighbor said I should ask for documentation. Can you email me proof at my email address?",
-        "I want to help but this has taken so long. Can you share one more verification detail for my safety?",
-        "I'll cooperate but I'm writing everything down. What is your company's registered address?",
-    ],
-    "otp": [
-        "I'm not sure what an OTP is. Can you explain the process? And why do you need it exactly?",
-        "My phone is showing some numbers. But first, can you verify my account number to prove who you are?",
-        "I received something on my phone. But my daughter said I should never share it. Can you explain why it's needed?",
-    ],
-    "upi": [
-        "I'm not very familiar with UPI. Can you share your official UPI ID first so I know where to send?",
-        "My son usually handles UPI payments. Can you tell me your registered business name on UPI?",
-        "Which UPI app should I use? And can you confirm your registered phone number with the UPI account?",
-    ],
-    "link": [
-        "I'm worried about clicking links. Can you tell me the official website domain so I can type it manually?",
-        "The link looks different from what I usually see. Can you confirm this is the official company website?",
-        "My antivirus is warning me about this link. Can you send it from your official email address instead?",
-    ],
-    "account": [
-        "I don't remember my full account number. Which branch opened my account? Can you verify from your end?",
-        "Before I share anything, can you tell me the last transaction on my account to prove you have access?",
-        "My account details are with my spouse. Can you share your reference number and I'll call back?",
-    ],
-    "benign": [
-        "Hello! Yes, I'm doing well, thank you. How can I help you?",
-        "Sure, that sounds nice. What did you have in mind?",
-        "Thank you for reaching out. Could you tell me more about what you need?",
-        "I'm good, thanks for asking! What's going on?",
-        "That sounds great! Let me know the details.",
-    ],
-}
+from requests.adapters import HTTPAdapter
+
+from config import HF_API_TOKEN, HF_MODEL, HF_BATCH_SIZE, HF_BATCH_WAIT_MS, HF_STREAM
+from keywords import KeywordMatcher
+from prompts import SYSTEM_PROMPT, FALLBACK_RESPONSES
+
+# ---- Message Classification ----
+
+SCAM_SIGNALS = frozenset({
+    "otp", "verify", "urgent", "blocked", "suspended", "kyc",
+    "fraud", "security", "transaction", "click", "link",
+    "immediately", "expired", "penalty", "legal", "arrest",
+    "fee", "charge", "transfer", "pin", "password", "cvv",
+    "compromised", "won", "prize", "lottery", "cashback",
+    "offer", "claim", "reward", "congratulations", "selected",
+    "http", "www", "bank", "account", "warning", "fast",
+    "act now", "last chance", "final", "expire", "hurry",
+    "reference", "department", "officer", "employee",
+})
+
+# Checked in order once a message is known to be suspicious
+CATEGORY_KEYWORDS = (
+    ("otp", ("otp", "one time", "verification code")),
+    ("upi", ("upi", "paytm", "gpay", "phonepe")),
+    ("link", ("link", "click", "http", "www", "url")),
+    ("account", ("account", "bank", "balance", "transfer")),
+)
+
+# keyword -> reply category; earlier categories win if a keyword repeats
+KEYWORD_CATEGORY = {}
+for _category, _keywords in reversed(CATEGORY_KEYWORDS):
+    KEYWORD_CATEGORY.update(dict.fromkeys(_keywords, _category))
+CATEGORY_PRIORITY = tuple(category for category, _ in CATEGORY_KEYWORDS)
+
+WHITESPACE = re.compile(r"\s+")
+
+ALL_KEYWORDS = SCAM_SIGNALS | frozenset(KEYWORD_CATEGORY)
+
+KEYWORDS = KeywordMatcher(ALL_KEYWORDS)
+
+
+def find_keywords(t: str) -> set:
+    """Return every classification keyword occurring in lowercased text, in one pass."""
+    return KEYWORDS.find(t)
 
 
 def get_contextual_category(text: str, turn: int) -> str:
     """Determine the best response category based on message content and turn."""
-    t = text.lower()
-
-    scam_signals = [
-        "otp", "verify", "urgent", "blocked", "suspended", "kyc",
-        "fraud", "security", "transaction", "click", "link",
-        "immediately", "expired", "penalty", "legal", "arrest",
-        "fee", "charge", "transfer", "pin", "password", "cvv",
-        "compromised", "won", "prize", "lottery", "cashback",
-        "offer", "claim", "reward", "congratulations", "selected",
-        "http", "www", "bank", "account", "warning", "fast",
-        "act now", "last chance", "final", "expire", "hurry",
-        "reference", "department", "officer", "employee",
-    ]
-    is_suspicious = any(sig in t for sig in scam_signals)
-
-    if not is_suspicious:
+    return category_for_lowered(text.lower(), turn)
+
+
+# Longer messages are classified uncached so the cache can't be filled
+# with arbitrarily large keys
+CATEGORY_CACHE_MAX_LEN = 256
+
+
+def category_for_lowered(t: str, turn: int) -> str:
+    """get_contextual_category for text the caller has already lowercased."""
+    if len(t) <= CATEGORY_CACHE_MAX_LEN:
+        return _cached_category(t, turn)
+    return _classify(t, turn)
+
+
+def _classify(t: str, turn: int) -> str:
+    hits = find_keywords(t)
+
+    if hits.isdisjoint(SCAM_SIGNALS):
         return "benign"
 
-    if "otp" in t or "one time" in t or "verification code" in t:
-        return "otp"
-    if "upi" in t or "paytm" in t or "gpay" in t or "phonepe" in t:
-        return "upi"
-    if "link" in t or "click" in t or "http" in t or "www" in t or "url" in t:
-        return "link"
-    if "account" in t or "bank" in t or "balance" in t or "transfer" in t:
-        return "account"
+    categories = {KEYWORD_CATEGORY[k] for k in hits if k in KEYWORD_CATEGORY}
+    for category in CATEGORY_PRIORITY:
+        if category in categories:
+            return category
 
     if turn < 3:
         return "early"
@@ -116,53 +102,355 @@ def get_contextual_category(text: str, turn: int) -> str:
         return "late"
 
 
-def call_huggingface(prompt: str) -> Optional[str]:
-    """Call HuggingFace Inference API for LLM response."""
-    if not HF_API_TOKEN:
+_cached_category = lru_cache(maxsize=4096)(_classify)
+
+
+HF_API_URL = f"https://api-inference.huggingface.co/models/{HF_MODEL}"
+HF_TIMEOUT = 15
+# How long a caller waits for a batched reply, including a little queueing
+HF_WAIT_TIMEOUT = HF_TIMEOUT + 1
+# Most HF requests in flight at once; further prompts queue and batch up
+HF_MAX_IN_FLIGHT = 16
+# Decided once at import: without a token the LLM path is skipped entirely
+HF_ENABLED = bool(HF_API_TOKEN)
+HF_HEADERS = {
+    "Authorization": f"Bearer {HF_API_TOKEN}",
+    "Connection": "keep-alive",
+}
+HF_STREAM_HEADERS = {**HF_HEADERS, "Accept": "text/event-stream"}
+
+HF_PARAMETERS = {
+    "max_new_tokens": 100,
+    "temperature": 0.7,
+    "do_sample": True,
+    "return_full_text": False,
+}
+
+
+# Shared keep-alive session so each turn reuses a pooled TLS connection.
+# No transport retries: one attempt must fit inside the caller's wait, or
+# batch threads keep working on replies nobody is waiting for.
+_HF_SESSION = requests.Session()
+_HF_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+
+
+def _clean_generated(item) -> Optional[str]:
+    """Pull a usable first-line reply out of one HF generation result."""
+    if isinstance(item, list):
+        item = item[0] if item else {}
+    if not isinstance(item, dict):
         return None
+    text = item.get("generated_text", "").strip()
+    if text and len(text) > 10 and len(text) < 300:
+        return text.split("\n")[0]
+    return None
+
+
+def _post_stream(prompt: str) -> Optional[str]:
+    """Stream a single completion and hang up as soon as the first line is complete."""
+    payload = {"inputs": prompt, "parameters": HF_PARAMETERS, "stream": True}
+    response = _HF_SESSION.post(
+        HF_API_URL, headers=HF_STREAM_HEADERS, json=payload, timeout=HF_TIMEOUT, stream=True,
+    )
+    try:
+        if response.status_code != 200:
+            return None
+        buffer = ""
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            token = json.loads(line[5:]).get("token") or {}
+            if token.get("special"):
+                continue
+            buffer += token.get("text", "")
+            if "\n" in buffer.lstrip() or len(buffer) >= 300:
+                break
+        return _clean_generated({"generated_text": buffer.strip().split("\n")[0]})
+    finally:
+        response.close()
+
+
+def _post_batch(prompts: List[str]) -> Optional[List[Optional[str]]]:
+    """
+    Send one or more prompts to the HF Inference API in a single request.
+    Returns None when the API refused several prompts as a batch (some
+    backends reject list inputs with a 4xx or answer with a single result);
+    network errors, timeouts and server errors give a None reply per prompt.
+    """
     try:
-        headers = {"Authorization": f"Bearer {HF_API_TOKEN}"}
+        if len(prompts) == 1 and HF_STREAM:
+            return [_post_stream(prompts[0])]
         payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_new_tokens": 100,
-                "temperature": 0.7,
-                "do_sample": True,
-                "return_full_text": False,
-            },
+            "inputs": prompts[0] if len(prompts) == 1 else prompts,
+            "parameters": HF_PARAMETERS,
         }
-        response = requests.post(
-            f"https://api-inference.huggingface.co/models/{HF_MODEL}",
-            headers=headers, json=payload, timeout=15,
-        )
+        response = _HF_SESSION.post(HF_API_URL, headers=HF_HEADERS, json=payload, timeout=HF_TIMEOUT)
+    except Exception:
+        return [None] * len(prompts)
+    rejected = 400 <= response.status_code < 500 and response.status_code not in (401, 403, 429)
+    try:
         if response.status_code == 200:
             result = response.json()
-            if isinstance(result, list) and result:
-                text = result[0].get("generated_text", "").strip()
-                if text and len(text) > 10 and len(text) < 300:
-                    return text.split("\n")[0]
+            if isinstance(result, list) and len(result) == len(prompts):
+                return [_clean_generated(item) for item in result]
+            rejected = True
+    except ValueError:
+        pass
+    return None if rejected and len(prompts) > 1 else [None] * len(prompts)
+
+
+class _HFBatcher:
+    """
+    Dynamic batcher for HF calls. Prompts submitted concurrently by
+    different sessions are collected for up to max_wait_ms (or until
+    max_batch prompts are queued) and sent as a single batched request.
+    The queue is only drained when one of max_in_flight request slots is
+    free, so under load prompts wait in the queue and go out in bigger
+    batches instead of lining up as one-prompt requests.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: int, max_in_flight: int):
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max(max_wait_ms, 0) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._slots = threading.Semaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="hf-batch")
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt: str) -> Future:
+        """Queue a prompt; the returned future resolves to the reply or None."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((prompt, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="hf-batcher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list):
+        replies: Optional[List[Optional[str]]] = None
+        try:
+            replies = _post_batch([prompt for prompt, _ in batch])
+            if replies is None:
+                # The backend won't take list inputs: stop batching and
+                # requeue these prompts to go out one at a time
+                self.max_batch = 1
+                for item in batch:
+                    self._queue.put(item)
+                batch = []
+        finally:
+            self._slots.release()
+            # Resolve every future even if the request blew up; callers that
+            # timed out have cancelled theirs, so those are skipped
+            for i, (_, future) in enumerate(batch):
+                if future.set_running_or_notify_cancel():
+                    future.set_result(replies[i] if replies and i < len(replies) else None)
+
+
+_BATCHER = _HFBatcher(HF_BATCH_SIZE, HF_BATCH_WAIT_MS, HF_MAX_IN_FLIGHT)
+
+
+def call_huggingface(prompt: str) -> Optional[str]:
+    """Call HuggingFace Inference API for LLM response (batched with concurrent calls)."""
+    if not HF_ENABLED:
+        return None
+    try:
+        return _BATCHER.submit(prompt).result(timeout=HF_WAIT_TIMEOUT)
+    except Exception:
         return None
+
+
+async def call_huggingface_async(prompt: str) -> Optional[str]:
+    """Awaitable variant of call_huggingface that never blocks the event loop."""
+    if not HF_ENABLED:
+        return None
+    try:
+        return await asyncio.wait_for(
+            asyncio.wrap_future(_BATCHER.submit(prompt)), timeout=HF_WAIT_TIMEOUT,
+        )
     except Exception:
         return None
 
 
+PROMPT_PREFIX = f"<s>[INST] {SYSTEM_PROMPT}\n\n"
+PROMPT_SUFFIX = "\nRespond as the person being called (1-3 sentences, ask one question): [/INST]"
+
+
+def format_history_line(msg: dict) -> str:
+    """Render one history message as a prompt line."""
+    role = "Scammer" if msg.get("sender") == "scammer" else "You"
+    return f"{role}: {msg.get('text', '')}\n"
+
+
+def build_prompt(current_text: str, conversation_history: list,
+                 history_tail: Optional[Iterable[str]] = None) -> str:
+    """
+    Build the instruction prompt from the system prompt and recent turns.
+    history_tail, when given, holds the already-formatted last 6 history lines.
+    """
+    if history_tail is None:
+        history_tail = [format_history_line(msg) for msg in conversation_history[-6:]]
+    parts = [PROMPT_PREFIX]
+    parts.extend(history_tail)
+    parts.append(f"Scammer: {current_text}\n")
+    parts.append(PROMPT_SUFFIX)
+    return "".join(parts)
+
+
+# ---- LLM Reply Cache ----
+# Scam templates are blasted across many sessions; identical messages
+# reuse the last good LLM reply instead of another HF round-trip.
+
+REPLY_CACHE_SIZE = 4096
+_reply_cache: "OrderedDict[str, str]" = OrderedDict()
+_reply_cache_lock = threading.Lock()
+
+
+def reply_cache_key(current_text: str, turn: int) -> str:
+    """Key a reply by category, coarse turn bucket, and normalized message text."""
+    t = current_text.lower()
+    category = category_for_lowered(t, turn)
+    normalized = WHITESPACE.sub(" ", t).strip()[:256]
+    key = f"{category}|{turn // 3}|{normalized}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def get_cached_reply(key: str, used_responses: Dict[str, None]) -> Optional[str]:
+    """Return a cached LLM reply not yet used in this session, if any."""
+    with _reply_cache_lock:
+        reply = _reply_cache.get(key)
+        if reply is not None:
+            _reply_cache.move_to_end(key)
+    if reply is None or reply in used_responses:
+        return None
+    return reply
+
+
+def cache_reply(key: str, reply: str):
+    """Store a successful LLM reply, evicting the least recently used entry."""
+    with _reply_cache_lock:
+        _reply_cache[key] = reply
+        _reply_cache.move_to_end(key)
+        if len(_reply_cache) > REPLY_CACHE_SIZE:
+            _reply_cache.popitem(last=False)
+
+
+# A session only needs to avoid repeating its recent LLM replies; the
+# insertion-ordered dict doubles as a bounded set, oldest evicted first.
+USED_RESPONSES_LIMIT = 128
+
+
+def remember_reply(used_responses: Dict[str, None], reply: str):
+    """Record a reply as used, evicting the oldest once over the limit."""
+    used_responses[reply] = None
+    if len(used_responses) > USED_RESPONSES_LIMIT:
+        del used_responses[next(iter(used_responses))]
+
+
+def _reply_steps(current_text: str, conversation_history: list, turn: int,
+                 used_responses: Dict[str, None], scam_detected: bool,
+                 used_masks: Optional[Dict[str, int]],
+                 history_tail: Optional[Iterable[str]],
+                 state_lock: Optional[threading.Lock]):
+    """
+    Reply logic shared by generate_reply and generate_reply_async, which
+    differ only in how they call the LLM. Yields the prompt to send (None
+    when no call is needed), is sent the LLM's reply, then yields the reply.
+    state_lock, if given, is held while the session's used-reply state is
+    read or written, but not during the LLM call.
+    """
+    guard = state_lock if state_lock is not None else nullcontext()
+    key = llm_reply = prompt = None
+    if HF_ENABLED:
+        key = reply_cache_key(current_text, turn)
+        with guard:
+            llm_reply = get_cached_reply(key, used_responses)
+        if not llm_reply:
+            prompt = build_prompt(current_text, conversation_history, history_tail)
+    generated = yield prompt
+    if generated:
+        cache_reply(key, generated)
+        llm_reply = generated
+    with guard:
+        if llm_reply:
+            remember_reply(used_responses, llm_reply)
+        else:
+            llm_reply = fallback_reply(
+                current_text, turn, used_masks if used_masks is not None else {}, scam_detected,
+            )
+    yield llm_reply
+
+
 def generate_reply(current_text: str, conversation_history: list,
-                   turn: int, used_responses: set, scam_detected: bool = False) -> str:
+                   turn: int, used_responses: Dict[str, None], scam_detected: bool = False,
+                   used_masks: Optional[Dict[str, int]] = None,
+                   history_tail: Optional[Iterable[str]] = None,
+                   state_lock: Optional[threading.Lock] = None) -> str:
     """Generate a reply using LLM with smart fallback and deduplication."""
-    # Try LLM first
-    if HF_API_TOKEN:
-        chat_context = ""
-        for msg in conversation_history[-6:]:
-            role = "Scammer" if msg.get("sender") == "scammer" else "You"
-            chat_context += f"{role}: {msg.get('text', '')}\n"
-        chat_context += f"Scammer: {current_text}\n"
-
-        prompt = f"<s>[INST] {SYSTEM_PROMPT}\n\n{chat_context}\nRespond as the person being called (1-3 sentences, ask one question): [/INST]"
-        llm_reply = call_huggingface(prompt)
-        if llm_reply:
-            return llm_reply
+    steps = _reply_steps(current_text, conversation_history, turn, used_responses,
+                         scam_detected, used_masks, history_tail, state_lock)
+    prompt = next(steps)
+    return steps.send(call_huggingface(prompt) if prompt is not None else None)
+
+
+async def generate_reply_async(current_text: str, conversation_history: list,
+                               turn: int, used_responses: Dict[str, None], scam_detected: bool = False,
+                               used_masks: Optional[Dict[str, int]] = None,
+                               history_tail: Optional[Iterable[str]] = None,
+                               state_lock: Optional[threading.Lock] = None) -> str:
+    """
+    Async variant of generate_reply for use from async FastAPI handlers.
+    With a state_lock the steps that take it run in the default executor,
+    so a thread holding the lock never stalls the event loop.
+    """
+    steps = _reply_steps(current_text, conversation_history, turn, used_responses,
+                         scam_detected, used_masks, history_tail, state_lock)
+    if state_lock is None:
+        prompt = next(steps)
+        return steps.send(await call_huggingface_async(prompt) if prompt is not None else None)
+    loop = asyncio.get_running_loop()
+    prompt = await loop.run_in_executor(None, next, steps)
+    generated = await call_huggingface_async(prompt) if prompt is not None else None
+    return await loop.run_in_executor(None, steps.send, generated)
+
+
+# ---- Fallback Response Selection ----
+# Responses are addressed by (category, index); a session tracks the
+# ones it has used as one int bitmask per category.
+
+CATEGORY_RESPONSES = {cat: tuple(responses) for cat, responses in FALLBACK_RESPONSES.items()}
+CATEGORY_MASKS = {cat: (1 << len(responses)) - 1 for cat, responses in CATEGORY_RESPONSES.items()}
 
-    # Fallback with deduplication
+
+@lru_cache(maxsize=1024)
+def set_bits(mask: int) -> tuple:
+    """Indices of the set bits in mask; computed once per mask actually seen."""
+    return tuple(i for i in range(mask.bit_length()) if mask >> i & 1)
+
+
+def fallback_reply(current_text: str, turn: int, used_masks: Dict[str, int],
+                   scam_detected: bool = False) -> str:
+    """Pick a rule-based reply, avoiding responses already used in the session."""
     category = get_contextual_category(current_text, turn)
 
     # If scam already detected in session, never use benign responses
@@ -174,21 +462,20 @@ def generate_reply(current_text: str, conversation_history: list,
         else:
             category = "late"
 
-    responses = FALLBACK_RESPONSES.get(category, FALLBACK_RESPONSES["early"])
-
-    available = [r for r in responses if r not in used_responses]
+    pick = category
+    available = CATEGORY_MASKS[category] & ~used_masks.get(category, 0)
     if not available:
         # Try other categories
         for cat in ["mid", "late", "early"]:
             if cat != category:
-                alt = [r for r in FALLBACK_RESPONSES[cat] if r not in used_responses]
+                alt = CATEGORY_MASKS[cat] & ~used_masks.get(cat, 0)
                 if alt:
-                    available = alt
+                    pick, available = cat, alt
                     break
 
     if not available:
-        available = responses
+        available = CATEGORY_MASKS[category]
 
-    reply = random.choice(available)
-    used_responses.add(reply)
-    return reply
+    idx = random.choice(set_bits(available))
+    used_masks[pick] = used_masks.get(pick, 0) | (1 << idx)
+    return CATEGORY_RESPONSES[pick][idx]
@@ -5,133 +5,165 @@ bank accounts, phishing links, and case/reference IDs.
 """
 
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
+
+try:
+    # google-re2 gives linear-time matching for the lookaround-free patterns
+    import re2 as linear_re
+except ImportError:
+    linear_re = re
 
 # Known email domains (to separate UPI from email)
-KNOWN_EMAIL_DOMAINS = {
+KNOWN_EMAIL_DOMAINS = frozenset({
     "gmail", "yahoo", "hotmail", "outlook", "protonmail", "icloud",
     "aol", "mail", "zoho", "yandex", "live", "msn", "rediffmail",
     "gmx", "inbox", "fastmail", "tutanota", "pm", "hey",
-}
+})
 
 # Known UPI provider suffixes
-KNOWN_UPI_PROVIDERS = {
+KNOWN_UPI_PROVIDERS = frozenset({
     "paytm", "ybl", "oksbi", "okaxis", "okicici", "okhdfcbank",
     "axisbank", "sbi", "hdfcbank", "icici", "kotak", "indus",
     "boi", "pnb", "canara", "unionbank", "rbl", "federal",
     "dbs", "hsbc", "sc", "citi", "idbi", "bob", "ubi",
-}
-
-
-def extract_phone_numbers(text: str) -> List[str]:
+})
+
+# The UPI pattern's domain part is letters only, so a candidate is a UPI ID
+# unless its handle is a known email provider (and not also a UPI handle).
+# Precomputing that difference makes the decision a single set lookup.
+EMAIL_ONLY_DOMAINS = KNOWN_EMAIL_DOMAINS - KNOWN_UPI_PROVIDERS
+
+# Links mentioning these domains anywhere are not reported as phishing
+SAFE_DOMAINS = ("google.com", "facebook.com", "twitter.com", "wikipedia.org")
+
+# Output categories, in the order they are reported
+INTELLIGENCE_KEYS = (
+    "phoneNumbers", "bankAccounts", "upiIds",
+    "phishingLinks", "emailAddresses", "caseIds",
+)
+
+# Compiled once at import; reused for every message. Phone and bank
+# patterns need lookbehind, which RE2 lacks, so they stay on stdlib re.
+# Alternatives are fused into one pattern only where their matches can never
+# overlap; overlapping forms (e.g. '+91-98...' and its bare 10 digits) are
+# intentionally reported separately, so those stay as distinct scans.
+PHONE_PATTERNS = [re.compile(p) for p in (
+    r'(\+91[-\s]?\d{10}|\+91[-\s]?\d{5}[-\s]?\d{5})',
+    r'(?<!\d)(\d{10})(?!\d)',
+    r'(\d{3}[-\s]\d{3}[-\s]\d{4})',
+    r'(\d{5}[-\s]\d{5})',
+)]
+UPI_PATTERN = linear_re.compile(r'\b([a-zA-Z0-9._-]{2,}@[a-zA-Z]{2,})\b')
+EMAIL_PATTERN = linear_re.compile(r'\b([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})\b')
+BANK_ACCOUNT_PATTERN = re.compile(r'(?<!\d)(\d{9,18})(?!\d)')
+LINK_PATTERN = linear_re.compile(r'(https?://[^\s\])<>\"\']+)')
+CASE_ID_PATTERNS = [linear_re.compile('(?i)' + p) for p in (
+    r'\b([A-Z]{2,5}-\d{3,10}|[A-Z]{2,5}\d{4,10})\b',
+    r'\b((?:CASE|REF|TXN|ORDER|POLICY|TKT)[:#\s]+[A-Z0-9-]{4,15})\b',
+    r'\b(\d{3,5}/[A-Z]{2,5}/\d{3,5})\b',
+)]
+SAFE_LINK_PATTERN = re.compile("|".join(map(re.escape, SAFE_DOMAINS)), re.IGNORECASE)
+NON_DIGIT = re.compile(r'[^\d]')
+HAS_ALPHA = re.compile(r'[A-Za-z]')
+HAS_DIGIT = re.compile(r'\d')
+# Every category needs a digit, an '@' or a URL scheme to match at all
+INTEL_SIGNAL = re.compile(r'[\d@]|http')
+
+
+def extract_phone_numbers(text: str) -> Set[str]:
     """Extract phone numbers in various Indian formats."""
-    patterns = [
-        r'(\+91[-\s]?\d{10})',
-        r'(\+91[-\s]?\d{5}[-\s]?\d{5})',
-        r'(?<!\d)(\d{10})(?!\d)',
-        r'(\d{3}[-\s]\d{3}[-\s]\d{4})',
-        r'(\d{5}[-\s]\d{5})',
-    ]
-    results = []
-    for p in patterns:
-        results.extend(re.findall(p, text))
-    cleaned = []
-    for num in set(results):
-        digits = re.sub(r'[^\d]', '', num)
-        if 10 <= len(digits) <= 13:
-            cleaned.append(num.strip())
-    return cleaned
+    # Every pattern yields exactly 10 or 12 digits bounded by a digit or '+',
+    # so candidates need no digit-count check or stripping afterwards.
+    results = set()
+    for p in PHONE_PATTERNS:
+        results.update(p.findall(text))
+    return results
 
 
-def extract_upi_ids(text: str) -> List[str]:
+def extract_upi_ids(text: str) -> Set[str]:
     """Extract UPI IDs, differentiating from email addresses."""
-    pattern = r'\b([a-zA-Z0-9._-]{2,}@[a-zA-Z]{2,})\b'
-    matches = re.findall(pattern, text)
-    upi_ids = []
-    for match in matches:
-        domain = match.split('@')[1].lower()
-        if domain in KNOWN_UPI_PROVIDERS:
-            upi_ids.append(match)
-        elif domain not in KNOWN_EMAIL_DOMAINS:
-            # No dot in domain and not a known email provider = likely UPI
-            if '.' not in domain:
-                upi_ids.append(match)
-    return list(set(upi_ids))
-
-
-def extract_emails(text: str) -> List[str]:
-    """Extract email addresses, excluding UPI IDs."""
-    pattern = r'\b([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})\b'
-    matches = re.findall(pattern, text)
-    upi_ids = extract_upi_ids(text)
-    return list(set(m for m in matches if m not in upi_ids))
-
-
-def extract_bank_accounts(text: str) -> List[str]:
+    matches = UPI_PATTERN.findall(text)
+    return {m for m in matches if m[m.rfind('@') + 1:].lower() not in EMAIL_ONLY_DOMAINS}
+
+
+def extract_emails(text: str, upi_ids: Optional[Set[str]] = None) -> Set[str]:
+    """Extract email addresses, excluding UPI IDs (pass them in to skip a re-scan)."""
+    matches = EMAIL_PATTERN.findall(text)
+    if upi_ids is None:
+        upi_ids = extract_upi_ids(text)
+    return set(matches) - upi_ids
+
+
+def extract_bank_accounts(text: str, phone_numbers: Optional[Set[str]] = None) -> Set[str]:
     """Extract bank account numbers (9-18 digits), excluding phone numbers."""
-    pattern = r'(?<!\d)(\d{9,18})(?!\d)'
-    matches = re.findall(pattern, text)
-    phones = set(re.sub(r'[^\d]', '', p) for p in extract_phone_numbers(text))
-    return list(set(m for m in matches if m not in phones and len(m) >= 9))
+    matches = BANK_ACCOUNT_PATTERN.findall(text)
+    # An isolated 10-digit run is always also a bare phone match, and every
+    # phone form other than +91 has exactly 10 digits, so only the +91 forms
+    # need their digits compared against the remaining runs.
+    if phone_numbers is None:
+        phone_numbers = PHONE_PATTERNS[0].findall(text)
+    intl_phones = {NON_DIGIT.sub('', p) for p in phone_numbers if p.startswith('+')}
+    return {m for m in matches if len(m) != 10 and m not in intl_phones}
 
 
-def extract_links(text: str) -> List[str]:
+def extract_links(text: str) -> Set[str]:
     """Extract suspicious URLs, filtering out safe domains."""
-    pattern = r'(https?://[^\s\])<>\"\']+)'
-    matches = re.findall(pattern, text)
-    safe_domains = {"google.com", "facebook.com", "twitter.com", "wikipedia.org"}
-    results = []
-    for link in set(matches):
+    results = set()
+    for link in set(LINK_PATTERN.findall(text)):
         link = link.rstrip('.,;:!?)')
-        if not any(safe in link.lower() for safe in safe_domains):
-            results.append(link)
+        if not SAFE_LINK_PATTERN.search(link):
+            results.add(link)
     return results
 
 
-def extract_case_ids(text: str) -> List[str]:
+def extract_case_ids(text: str) -> Set[str]:
     """Extract case/reference IDs with letter+digit requirement."""
-    patterns = [
-        r'\b([A-Z]{2,5}-\d{3,10})\b',
-        r'\b([A-Z]{2,5}\d{4,10})\b',
-        r'\b((?:CASE|REF|TXN|ORDER|POLICY|TKT)[:#\s]+[A-Z0-9-]{4,15})\b',
-        r'\b(\d{3,5}/[A-Z]{2,5}/\d{3,5})\b',
-    ]
     results = []
-    for p in patterns:
-        results.extend(re.findall(p, text, re.IGNORECASE))
-    cleaned = []
+    for p in CASE_ID_PATTERNS:
+        results.extend(p.findall(text))
+    cleaned = set()
     for m in set(m.strip() for m in results):
-        if len(m) >= 5 and re.search(r'[A-Za-z]', m) and re.search(r'\d', m):
-            cleaned.append(m)
+        if len(m) >= 5 and HAS_ALPHA.search(m) and HAS_DIGIT.search(m):
+            cleaned.add(m)
     return cleaned
 
 
-def extract_all_intelligence(text: str) -> Dict[str, List[str]]:
-    """Extract all types of intelligence from a text."""
+def empty_intelligence() -> Dict[str, Set[str]]:
+    """Fresh intelligence dict with an empty set for every category."""
+    return {key: set() for key in INTELLIGENCE_KEYS}
+
+
+def extract_all_intelligence(text: str) -> Dict[str, Set[str]]:
+    """
+    Extract all types of intelligence from a text.
+    Each pattern family runs at most once, and families whose trigger
+    character (digit, '@', 'http') is absent from the text are skipped;
+    short pleasantries with none of them return immediately.
+    """
+    if not INTEL_SIGNAL.search(text):
+        return empty_intelligence()
+    has_digit = HAS_DIGIT.search(text) is not None
+    phones = extract_phone_numbers(text) if has_digit else set()
+    upi_ids = extract_upi_ids(text) if '@' in text else set()
     return {
-        "phoneNumbers": extract_phone_numbers(text),
-        "bankAccounts": extract_bank_accounts(text),
-        "upiIds": extract_upi_ids(text),
-        "phishingLinks": extract_links(text),
-        "emailAddresses": extract_emails(text),
-        "caseIds": extract_case_ids(text),
+        "phoneNumbers": phones,
+        "bankAccounts": extract_bank_accounts(text, phones) if has_digit else set(),
+        "upiIds": upi_ids,
+        "phishingLinks": extract_links(text) if 'http' in text else set(),
+        "emailAddresses": extract_emails(text, upi_ids) if '@' in text else set(),
+        "caseIds": extract_case_ids(text) if has_digit else set(),
     }
 
 
-def merge_intelligence(existing: Dict, new: Dict) -> Dict:
-    """Merge two intelligence dictionaries, deduplicating values."""
-    merged = {}
-    for key in existing:
-        merged[key] = list(set(existing.get(key, []) + new.get(key, [])))
-    return merged
+def update_intelligence(existing: Dict[str, Set[str]], new: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    """Merge new intelligence sets into existing in place; costs O(len(new)) per merge."""
+    for key, values in new.items():
+        if values:
+            existing.setdefault(key, set()).update(values)
+    return existing
+
 
+def intelligence_to_lists(intel: Dict[str, Set[str]]) -> Dict[str, List[str]]:
+    """Serialize intelligence sets as sorted lists, in the canonical key order."""
+    return {key: sorted(intel.get(key, ())) for key in INTELLIGENCE_KEYS}
 
-def scan_full_history(conversation_history: list) -> Dict[str, List[str]]:
-    """Scan all scammer messages in conversation history for intelligence."""
-    combined = {"phoneNumbers": [], "bankAccounts": [], "upiIds": [],
-                "phishingLinks": [], "emailAddresses": [], "caseIds": []}
-    for msg in conversation_history:
-        if msg.get("sender") == "scammer":
-            intel = extract_all_intelligence(msg.get("text", ""))
-            combined = merge_intelligence(combined, intel)
-    return combined
@@ -0,0 +1,47 @@
+"""
+Multi-keyword substring matching.
+Finds every keyword from a fixed set that occurs in a text in a single
+pass — an Aho-Corasick automaton when pyahocorasick is installed,
+otherwise one precompiled regex alternation.
+"""
+
+import re
+from typing import Iterable, Set
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class KeywordMatcher:
+    """Reports which of a fixed set of (lowercase) keywords occur in a text."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = frozenset(keywords)
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            # Zero-width lookahead so overlapping keywords are all reported.
+            # Longest keywords come first; a shorter keyword that is a prefix
+            # of a hit is added back from the prefix table.
+            self._pattern = re.compile(
+                "(?=(" + "|".join(map(re.escape, sorted(self.keywords, key=len, reverse=True))) + "))"
+            )
+            self._prefixes = {
+                keyword: frozenset(k for k in self.keywords if k != keyword and keyword.startswith(k))
+                for keyword in self.keywords
+            }
+
+    def find(self, t: str) -> Set[str]:
+        """Return every keyword occurring in lowercased text t."""
+        if self._automaton is not None:
+            return {keyword for _, keyword in self._automaton.iter(t)}
+        hits = set(self._pattern.findall(t))
+        for keyword in list(hits):
+            hits |= self._prefixes[keyword]
+        return hits
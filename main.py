@@ -4,33 +4,91 @@ A scam detection and engagement honeypot that extracts intelligence
 from scammers through multi-turn conversations.
 """
 
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, Header, HTTPException, Body, BackgroundTasks
-from typing import Optional, Dict, Any
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Optional, Dict, Any, List, Union
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import logging
 
-from config import API_KEY, GUVI_CALLBACK_URL, FINAL_OUTPUT_MIN_TURN
-from conversation import generate_reply
+try:
+    # orjson serializes callback payloads in C when installed
+    import orjson
+except ImportError:
+    orjson = None
+
+from config import API_KEY, GUVI_CALLBACK_URL, FINAL_OUTPUT_MIN_TURN, ASYNC_LLM
+from conversation import generate_reply, generate_reply_async
+from extraction import intelligence_to_lists
 from session_manager import (
-    get_or_create_session,
+    start_turn,
     update_session,
     build_final_output,
+    take_final_output,
     get_session,
-    mark_callback_sent,
+    evict_expired_sessions,
+    session_lock,
 )
 
+# Pooled keep-alive session for callback submissions
+CALLBACK_SESSION = requests.Session()
+CALLBACK_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+CALLBACK_SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("honeypot")
 
+SESSION_SWEEP_INTERVAL = 60
+
+
+async def sweep_sessions():
+    """Periodically evict sessions that have been idle past their TTL."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        evicted = await run_in_threadpool(evict_expired_sessions)
+        if evicted:
+            logger.info("Evicted %d expired sessions", evicted)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the session sweeper for the lifetime of the app."""
+    sweeper = asyncio.create_task(sweep_sessions())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        with suppress(asyncio.CancelledError):
+            await sweeper
+
+
 app = FastAPI(
     title="Agentic Honeypot API",
     description="AI-powered scam detection and intelligence extraction honeypot",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
 
+# Fields are optional and loosely typed so that missing or null values reach
+# the handler's 400 check instead of failing validation with a 422
+class Message(BaseModel):
+    sender: Optional[str] = "scammer"
+    text: Optional[str] = ""
+
+
+class HoneypotRequest(BaseModel):
+    sessionId: Optional[Union[str, int]] = ""
+    message: Optional[Message] = Message()
+    conversationHistory: List[Dict[str, Any]] = []
+    metadata: Optional[Dict[str, Any]] = {}
+
+
 @app.get("/")
 def root():
     return {
@@ -40,7 +98,7 @@ def root():
     }
 
 
-@app.get("/health")
+@app.api_route("/health", methods=["GET", "HEAD"])
 def health():
     return {"status": "healthy", "timestamp": time.time()}
 
@@ -49,18 +107,32 @@ def send_callback(payload: Dict[str, Any]):
     """Send final output to the evaluation callback URL."""
     try:
         headers = {"Content-Type": "application/json"}
-        response = requests.post(
-            GUVI_CALLBACK_URL, json=payload, headers=headers, timeout=10
-        )
-        logger.info(f"Callback sent for session {payload.get('sessionId')}: {response.status_code}")
+        if orjson is not None:
+            response = CALLBACK_SESSION.post(
+                GUVI_CALLBACK_URL, data=orjson.dumps(payload), headers=headers, timeout=10
+            )
+        else:
+            response = CALLBACK_SESSION.post(
+                GUVI_CALLBACK_URL, json=payload, headers=headers, timeout=10
+            )
+        logger.info("Callback sent for session %s: %s", payload.get("sessionId"), response.status_code)
     except Exception as e:
-        logger.error(f"Callback failed for session {payload.get('sessionId')}: {e}")
+        logger.error("Callback failed for session %s: %s", payload.get("sessionId"), e)
+
+
+def record_turn(session_id: str, text: str, conversation_history: list,
+                reply: str, turn: int) -> Optional[Dict[str, Any]]:
+    """Fold the turn into the session; returns the final output once it is due."""
+    update_session(session_id, text, conversation_history, reply)
+    if turn >= FINAL_OUTPUT_MIN_TURN:
+        return take_final_output(session_id)
+    return None
 
 
 @app.post("/honeypot")
-def honeypot(
-    payload: Dict[str, Any] = Body(...),
-    background_tasks: BackgroundTasks = None,
+async def honeypot(
+    background_tasks: BackgroundTasks,
+    req: HoneypotRequest,
     x_api_key: Optional[str] = Header(None),
 ):
     """
@@ -72,10 +144,9 @@ def honeypot(
         raise HTTPException(status_code=401, detail="Invalid API Key")
 
     # Parse request
-    session_id = payload.get("sessionId", "")
-    message = payload.get("message", {})
-    text = message.get("text", "")
-    conversation_history = payload.get("conversationHistory", [])
+    session_id = req.sessionId
+    text = req.message.text if req.message is not None else None
+    conversation_history = req.conversationHistory
 
     if not session_id or not text:
         raise HTTPException(status_code=400, detail="Missing sessionId or message text")
@@ -83,39 +154,39 @@ def honeypot(
     # Calculate turn number
     turn = len(conversation_history)
 
-    logger.info(f"Session {session_id} | Turn {turn + 1} | Message: {text[:80]}")
+    logger.info("Session %s | Turn %d | Message: %.80s", session_id, turn + 1, text)
 
-    # Get session
-    session = get_or_create_session(session_id)
+    # Session locks are plain threading locks, so everything that takes one
+    # runs in the threadpool rather than on the event loop
+    session, history_tail = await run_in_threadpool(start_turn, session_id, conversation_history)
 
-    # Generate reply using LLM with fallback
-    reply = generate_reply(
+    # Generate reply using LLM with fallback; the lock guards the used-reply
+    # state but is released while waiting on the LLM
+    reply_kwargs = dict(
         current_text=text,
         conversation_history=conversation_history,
         turn=turn,
-        used_responses=session.get("usedResponses", set()),
+        used_responses=session.get("usedResponses", {}),
         scam_detected=session.get("scamDetected", False),
+        used_masks=session.get("usedFallbackMasks", {}),
+        history_tail=history_tail,
+        state_lock=session_lock(session_id),
     )
+    if ASYNC_LLM:
+        reply = await generate_reply_async(**reply_kwargs)
+    else:
+        reply = await run_in_threadpool(generate_reply, **reply_kwargs)
 
-    # Update session with new intelligence and metrics
-    session = update_session(session_id, text, conversation_history, reply)
-
-    logger.info(f"Session {session_id} | Reply: {reply[:80]}")
+    # Update session with new intelligence and metrics, and from
+    # FINAL_OUTPUT_MIN_TURN on take the progressive final output
+    final_payload = await run_in_threadpool(record_turn, session_id, text, conversation_history, reply, turn)
 
-    # Progressive final output — send callback after FINAL_OUTPUT_MIN_TURN
-    if turn >= FINAL_OUTPUT_MIN_TURN:
-        final_payload = build_final_output(session_id)
-
-        if background_tasks:
-            background_tasks.add_task(send_callback, final_payload)
-        else:
-            try:
-                send_callback(final_payload)
-            except Exception:
-                pass
+    logger.info("Session %s | Reply: %.80s", session_id, reply)
 
-        mark_callback_sent(session_id)
-        logger.info(f"Session {session_id} | Final output sent (turn {turn + 1})")
+    # The session may have been evicted before the final output was taken
+    if final_payload is not None:
+        background_tasks.add_task(send_callback, final_payload)
+        logger.info("Session %s | Final output sent (turn %d)", session_id, turn + 1)
 
     return {
         "status": "success",
@@ -136,11 +207,11 @@ def manual_final_output(
     if not session_id:
         raise HTTPException(status_code=400, detail="Missing sessionId")
 
-    session = get_session(session_id)
-    if not session:
+    final_output = build_final_output(session_id)
+    if final_output is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    return build_final_output(session_id)
+    return final_output
 
 
 @app.get("/session/{session_id}")
@@ -153,12 +224,23 @@ def debug_session(session_id: str, x_api_key: Optional[str] = Header(None)):
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    safe_session = {k: v for k, v in session.items() if k != "usedResponses"}
-    safe_session["usedResponsesCount"] = len(session.get("usedResponses", set()))
+    # update_session may be mutating these sets in another thread
+    with session_lock(session_id):
+        safe_session = {
+            k: v for k, v in session.items() if k not in ("usedResponses", "usedFallbackMasks", "historyTail", "scamKeywordHits")
+        }
+        safe_session["intelligence"] = intelligence_to_lists(session["intelligence"])
+        safe_session["redFlagsFound"] = sorted(session["redFlagsFound"])
+        safe_session["usedResponsesCount"] = len(session.get("usedResponses", {})) + sum(
+            bin(mask).count("1") for mask in session.get("usedFallbackMasks", {}).values()
+        )
 
     return safe_session
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    from config import WORKERS
+    uvicorn.run(
+        "main:app", host="0.0.0.0", port=8000, workers=WORKERS, log_level="info",
+    )
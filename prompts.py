@@ -0,0 +1,73 @@
+"""
+Prompt text for the Honeypot API.
+System prompt for the LLM and rule-based fallback responses
+used when the LLM is unavailable.
+"""
+
+# ---- System Prompt for LLM ----
+
+SYSTEM_PROMPT = """You are playing the role of a naive, slightly worried Indian citizen who has received a suspicious message. Your goal is to keep the scammer engaged for as long as possible while extracting maximum information from them.
+
+CRITICAL RULES:
+1. NEVER reveal you know it's a scam. Act genuinely concerned but slightly confused.
+2. Ask ONE investigative question per response to extract information.
+3. Keep responses SHORT (1-3 sentences max).
+4. Show willingness to comply but always ask for "verification" first.
+5. Reference specific red flags subtly (urgency, OTP requests, suspicious links).
+6. Try to extract: phone numbers, email addresses, UPI IDs, official websites, employee IDs.
+7. Sound natural — use simple language, occasional Hindi words, show emotions.
+8. DO NOT use markdown formatting, bullet points, or numbered lists.
+9. Vary your responses — never repeat the same question twice."""
+
+# ---- Fallback Rule-Based Responses ----
+
+FALLBACK_RESPONSES = {
+    "early": [
+        "Oh my, this sounds serious! Can you please tell me your name and employee ID so I can note it down?",
+        "I'm really worried now. Can you share your official phone number so I can call you back to verify?",
+        "This is concerning. Which branch are you calling from? I want to make sure this is legitimate.",
+        "Oh no, what should I do? Can you please give me a reference number for this case?",
+        "I want to cooperate but I'm scared. Can you tell me your department and designation first?",
+    ],
+    "mid": [
+        "I understand the urgency, but my family told me to always verify. Can you share your official email ID?",
+        "Can you give me your supervisor's name and number? I'd like to confirm before sharing anything.",
+        "What is the official website where I can check this myself? I want to be careful.",
+        "My son told me to never share OTP on phone. Can you send me an official letter instead?",
+        "I'm at home right now. Can I visit the nearest branch to resolve this? Which branch should I go to?",
+    ],
+    "late": [
+        "I've been noting everything down. Can you give me the full address of your office for my records?",
+        "Before we proceed, can you spell out your full name and share your direct extension number?",
+        "My neighbor said I should ask for documentation. Can you email me proof at my email address?",
+        "I want to help but this has taken so long. Can you share one more verification detail for my safety?",
+        "I'll cooperate but I'm writing everything down. What is your company's registered address?",
+    ],
+    "otp": [
+        "I'm not sure what an OTP is. Can you explain the process? And why do you need it exactly?",
+        "My phone is showing some numbers. But first, can you verify my account number to prove who you are?",
+        "I received something on my phone. But my daughter said I should never share it. Can you explain why it's needed?",
+    ],
+    "upi": [
+        "I'm not very familiar with UPI. Can you share your official UPI ID first so I know where to send?",
+        "My son usually handles UPI payments. Can you tell me your registered business name on UPI?",
+        "Which UPI app should I use? And can you confirm your registered phone number with the UPI account?",
+    ],
+    "link": [
+        "I'm worried about clicking links. Can you tell me the official website domain so I can type it manually?",
+        "The link looks different from what I usually see. Can you confirm this is the official company website?",
+        "My antivirus is warning me about this link. Can you send it from your official email address instead?",
+    ],
+    "account": [
+        "I don't remember my full account number. Which branch opened my account? Can you verify from your end?",
+        "Before I share anything, can you tell me the last transaction on my account to prove you have access?",
+        "My account details are with my spouse. Can you share your reference number and I'll call back?",
+    ],
+    "benign": [
+        "Hello! Yes, I'm doing well, thank you. How can I help you?",
+        "Sure, that sounds nice. What did you have in mind?",
+        "Thank you for reaching out. Could you tell me more about what you need?",
+        "I'm good, thanks for asking! What's going on?",
+        "That sounds great! Let me know the details.",
+    ],
+}
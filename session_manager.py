@@ -4,9 +4,19 @@ Thread-safe session tracking with scam detection, intelligence merging,
 red flag identification, and final output builder.
 """
 
+import threading
 import time
-from typing import Dict, Any
-from extraction import extract_all_intelligence, merge_intelligence, scan_full_history
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional, Set, Tuple
+from config import MAX_SESSIONS, SESSION_TTL_SECONDS
+from conversation import format_history_line
+from keywords import KeywordMatcher
+from extraction import (
+    empty_intelligence,
+    extract_all_intelligence,
+    intelligence_to_lists,
+    update_intelligence,
+)
 
 # Scam type classification patterns
 SCAM_PATTERNS = {
@@ -40,48 +50,127 @@ RED_FLAG_KEYWORDS = [
     "arrest", "legal", "penalty", "hurry", "last chance",
 ]
 
-# In-memory session store
-session_store: Dict[str, Dict[str, Any]] = {}
+RED_FLAGS = frozenset(RED_FLAG_KEYWORDS)
+
+# Single-pass matcher over every scam-type and red-flag keyword
+KEYWORDS = KeywordMatcher(
+    [k for keywords in SCAM_PATTERNS.values() for k in keywords] + RED_FLAG_KEYWORDS
+)
+
+AGENT_NOTES_TEMPLATE = (
+    "Scam type detected: %s. "
+    "Red flags identified: %s. "
+    "Scammer used social engineering tactics including urgency, impersonation, and verification pressure. "
+    "Total questions asked: %d. "
+    "Intelligence extracted across %d messages."
+)
+
+# In-memory session store, kept in least-recently-used order and capped
+# at MAX_SESSIONS; idle sessions are also dropped after SESSION_TTL_SECONDS
+session_store: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Guards only the store's structure (lookup, LRU order, eviction); session
+# state is guarded by striped locks so different sessions never contend
+_store_lock = threading.Lock()
+_LOCK_SHARDS = [threading.Lock() for _ in range(64)]
+
+
+def session_lock(session_id: str) -> threading.Lock:
+    """Stripe lock guarding the state of the given session."""
+    return _LOCK_SHARDS[hash(session_id) & 63]
+
+
+def _new_session() -> Dict[str, Any]:
+    """Initial state for a session."""
+    now = time.time()
+    return {
+        "startTime": now,
+        "lastActivity": now,
+        "scamDetected": False,
+        "scamType": "unknown",
+        "confidenceLevel": 0.0,
+        "intelligence": empty_intelligence(),
+        "redFlagsFound": set(),
+        "questionsAsked": 0,
+        "totalMessagesExchanged": 0,
+        "callbackSent": False,
+        "usedResponses": {},
+        "usedFallbackMasks": {},
+        "historyTail": deque(maxlen=6),
+        "historyScannedCount": 0,
+        "scamKeywordHits": set(),
+    }
 
 
 def get_or_create_session(session_id: str) -> Dict[str, Any]:
     """Get existing session or create a new one."""
-    if session_id not in session_store:
-        session_store[session_id] = {
-            "startTime": time.time(),
-            "scamDetected": False,
-            "scamType": "unknown",
-            "confidenceLevel": 0.0,
-            "intelligence": {
-                "phoneNumbers": [], "bankAccounts": [], "upiIds": [],
-                "phishingLinks": [], "emailAddresses": [], "caseIds": [],
-            },
-            "redFlagsFound": [],
-            "questionsAsked": 0,
-            "totalMessagesExchanged": 0,
-            "callbackSent": False,
-            "usedResponses": set(),
-        }
-    return session_store[session_id]
-
-
-def get_session(session_id: str):
+    with _store_lock:
+        session = session_store.get(session_id)
+        if session is None:
+            session = session_store[session_id] = _new_session()
+            if len(session_store) > MAX_SESSIONS:
+                session_store.popitem(last=False)
+        else:
+            session_store.move_to_end(session_id)
+            session["lastActivity"] = time.time()
+        return session
+
+
+def evict_expired_sessions() -> int:
+    """Drop sessions idle for longer than SESSION_TTL_SECONDS; returns how many."""
+    cutoff = time.time() - SESSION_TTL_SECONDS
+    evicted = 0
+    with _store_lock:
+        # LRU order means the stalest sessions are at the front
+        while session_store:
+            session_id, session = next(iter(session_store.items()))
+            if session["lastActivity"] >= cutoff:
+                break
+            del session_store[session_id]
+            evicted += 1
+    return evicted
+
+
+def get_session(session_id: str) -> Optional[Dict[str, Any]]:
     """Get session by ID, returns None if not found."""
-    return session_store.get(session_id)
+    with _store_lock:
+        return session_store.get(session_id)
+
+
+def sync_history_tail(session: Dict[str, Any], conversation_history: list) -> deque:
+    """
+    Bring the session's pre-formatted last-6 history lines up to date,
+    formatting only messages after the one the tail currently ends on.
+    Clients may send a fixed-size window, so new messages are found by
+    locating that last line in the history rather than by its length.
+    Caller holds the session's stripe lock.
+    """
+    tail = session["historyTail"]
+    start = max(len(conversation_history) - 6, 0)
+    if tail:
+        for i in range(len(conversation_history) - 1, start - 1, -1):
+            if format_history_line(conversation_history[i]) == tail[-1]:
+                start = i + 1
+                break
+        else:
+            # History was reset or replaced by the client; start over
+            tail.clear()
+    for msg in conversation_history[start:]:
+        tail.append(format_history_line(msg))
+    return tail
 
 
-def mark_callback_sent(session_id: str):
-    """Mark that the callback has been sent for a session."""
-    if session_id in session_store:
-        session_store[session_id]["callbackSent"] = True
+def start_turn(session_id: str, conversation_history: list) -> Tuple[Dict[str, Any], tuple]:
+    """Get or create the session and return it with its synced history tail."""
+    session = get_or_create_session(session_id)
+    with session_lock(session_id):
+        return session, tuple(sync_history_tail(session, conversation_history))
 
 
-def classify_scam(text: str) -> tuple:
-    """Classify scam type based on keyword scoring."""
-    t = text.lower()
+def score_scam_keywords(hits: Set[str]) -> tuple:
+    """Classify scam type from the set of keywords seen."""
     scores = {}
     for scam_type, keywords in SCAM_PATTERNS.items():
-        score = sum(1 for k in keywords if k in t)
+        score = sum(1 for k in keywords if k in hits)
         if score > 0:
             scores[scam_type] = score
     if scores:
@@ -95,56 +184,74 @@ def update_session(session_id: str, text: str, conversation_history: list, reply
     """Update session with new intelligence, scam detection, and metrics."""
     session = get_or_create_session(session_id)
 
-    # Extract from current message
-    current_intel = extract_all_intelligence(text)
-
-    # Also scan full history
-    history_intel = scan_full_history(conversation_history)
+    with session_lock(session_id):
+        # Only the current message and history messages that arrived since
+        # the previous turn are processed; earlier ones are already folded in
+        scanned = session["historyScannedCount"]
+        if scanned > len(conversation_history):
+            scanned = 0
+        new_history = conversation_history[scanned:]
+        session["historyScannedCount"] = len(conversation_history)
 
-    # Merge all intelligence
-    session["intelligence"] = merge_intelligence(session["intelligence"], current_intel)
-    session["intelligence"] = merge_intelligence(session["intelligence"], history_intel)
+        text_hits = KEYWORDS.find(text.lower())
+        session["scamKeywordHits"] |= text_hits
+        update_intelligence(session["intelligence"], extract_all_intelligence(text))
+        for msg in new_history:
+            if msg.get("sender") == "scammer":
+                msg_text = msg.get("text", "")
+                session["scamKeywordHits"] |= KEYWORDS.find(msg_text.lower())
+                update_intelligence(session["intelligence"], extract_all_intelligence(msg_text))
 
-    # Detect scam using full conversation text
-    full_text = text + " " + " ".join(
-        m.get("text", "") for m in conversation_history if m.get("sender") == "scammer"
-    )
-    scam_type, confidence = classify_scam(full_text)
-    if confidence > 0:
-        session["scamDetected"] = True
-        if confidence > session["confidenceLevel"]:
-            session["scamType"] = scam_type
-            session["confidenceLevel"] = confidence
+        # Detect scam from every keyword the scammer has used so far
+        scam_type, confidence = score_scam_keywords(session["scamKeywordHits"])
+        if confidence > 0:
+            session["scamDetected"] = True
+            if confidence > session["confidenceLevel"]:
+                session["scamType"] = scam_type
+                session["confidenceLevel"] = confidence
 
-    # Red flags
-    t = text.lower()
-    for flag in RED_FLAG_KEYWORDS:
-        if flag in t and flag not in session["redFlagsFound"]:
-            session["redFlagsFound"].append(flag)
+        # Red flags
+        session["redFlagsFound"] |= text_hits & RED_FLAGS
 
-    # Questions asked
-    session["questionsAsked"] += reply.count("?")
+        # Questions asked
+        session["questionsAsked"] += reply.count("?")
 
-    # Message count — history + current scammer message + our reply
-    session["totalMessagesExchanged"] = len(conversation_history) + 2
+        # Message count — history + current scammer message + our reply
+        session["totalMessagesExchanged"] = len(conversation_history) + 2
 
     return session
 
 
-def build_final_output(session_id: str) -> Dict[str, Any]:
-    """Build the final output payload for submission."""
-    session = get_or_create_session(session_id)
+def build_final_output(session_id: str) -> Optional[Dict[str, Any]]:
+    """Build the final output payload for submission; None if the session is unknown."""
+    session = get_session(session_id)
+    if session is None:
+        return None
+    with session_lock(session_id):
+        return _final_output(session_id, session)
+
+
+def take_final_output(session_id: str) -> Optional[Dict[str, Any]]:
+    """Build the final output and mark its callback sent; None if the session is unknown."""
+    session = get_session(session_id)
+    if session is None:
+        return None
+    with session_lock(session_id):
+        final_output = _final_output(session_id, session)
+        session["callbackSent"] = True
+        return final_output
+
+
+def _final_output(session_id: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    """Final output payload for a session; caller holds its stripe lock."""
     duration = int(time.time() - session["startTime"])
 
     is_scam = session["scamDetected"]
 
-    red_flags_str = ", ".join(session["redFlagsFound"][:10]) if session["redFlagsFound"] else "suspicious behavior"
-    agent_notes = (
-        f"Scam type detected: {session['scamType']}. "
-        f"Red flags identified: {red_flags_str}. "
-        f"Scammer used social engineering tactics including urgency, impersonation, and verification pressure. "
-        f"Total questions asked: {session['questionsAsked']}. "
-        f"Intelligence extracted across {session['totalMessagesExchanged']} messages."
+    red_flags_str = ", ".join(sorted(session["redFlagsFound"])[:10]) if session["redFlagsFound"] else "suspicious behavior"
+    agent_notes = AGENT_NOTES_TEMPLATE % (
+        session["scamType"], red_flags_str,
+        session["questionsAsked"], session["totalMessagesExchanged"],
     )
 
     return {
@@ -154,13 +261,6 @@ def build_final_output(session_id: str) -> Dict[str, Any]:
         "confidenceLevel": max(session["confidenceLevel"], 0.75) if is_scam else 0.0,
         "totalMessagesExchanged": session["totalMessagesExchanged"],
         "engagementDurationSeconds": max(duration, 1),
-        "extractedIntelligence": {
-            "phoneNumbers": session["intelligence"]["phoneNumbers"],
-            "bankAccounts": session["intelligence"]["bankAccounts"],
-            "upiIds": session["intelligence"]["upiIds"],
-            "phishingLinks": session["intelligence"]["phishingLinks"],
-            "emailAddresses": session["intelligence"]["emailAddresses"],
-            "caseIds": session["intelligence"]["caseIds"],
-        },
+        "extractedIntelligence": intelligence_to_lists(session["intelligence"]),
         "agentNotes": agent_notes,
     }